@@ -5,18 +5,22 @@ Example usage:
 ```bash
 python scripts/import_webflow.py web export.webflow.zip
 ```
+Pass `--pretty` to indent the updated html files, e.g., when debugging.
+
 Note: you must be in the root of the project to run this script.
 """
+import argparse
 import zipfile
 import sys
 from pathlib import Path
 import os
-import shutil
 import logging
 import re
-from bs4 import BeautifulSoup, formatter
+from concurrent.futures import ProcessPoolExecutor
+from functools import partial
+from lxml import etree, html
 from send2trash import send2trash
-from typing import List
+from typing import Dict, List
 
 
 make_forms_async = """
@@ -47,6 +51,37 @@ make_forms_async = """
     const forms = document.querySelectorAll('form');
     forms.forEach(form => form.addEventListener('submit', event => submitForm(event, form)));
 """
+make_forms_async_script = f"<script>{make_forms_async}</script>"
+
+# libxml2 percent-encodes these attributes when serializing html, which mangles django template tags
+# (e.g., {% url 'home' %}) and values like "mailto:...?subject=Hi there". So update_html swaps them for
+# placeholders and substitutes the original values after serializing.
+URI_ATTRIBUTES_XPATH = etree.XPath("//@href | //@src | //@action | //a/@name")
+ATTRIBUTE_PLACEHOLDER = "__webflow_to_django_attribute_{}__"
+ATTRIBUTE_PLACEHOLDER_RE = re.compile(r'"__webflow_to_django_attribute_(\d+)__"')
+
+
+def quote_attribute_value(value: str) -> str:
+    """
+    Quote an attribute value for html, keeping any django template tags in it intact.
+    """
+    value = value.replace('&', '&amp;')
+    if '"' in value and "'" not in value:  # E.g., {% url "home" %}
+        return f"'{value}'"
+    return '"' + value.replace('"', '&quot;') + '"'
+
+# Webflow exports are utf-8. Don't let libxml2 guess the encoding or add a doctype the page didn't have.
+HTML_PARSER = html.HTMLParser(encoding='utf-8', default_doctype=False)
+
+# The elements that update_html rewrites, compiled once rather than for every html file.
+REWRITTEN_ELEMENTS_XPATH = etree.XPath(
+    "//link[starts-with(@href, 'css') or starts-with(@href, 'images')]"
+    " | //img[starts-with(@src, 'images') or starts-with(@srcset, 'images') or @data-for]"
+    " | //script[starts-with(@src, 'js')]"
+    " | //div[@data-animation-type='lottie' and starts-with(@data-src, 'documents')]"
+    " | //*[self::div or self::li or self::ul][@data-for]"
+    " | //form"
+)
 
 
 class WebflowImporter:
@@ -60,171 +95,211 @@ class WebflowImporter:
             'documents': [],
         }
 
-    def move_static_file(self, work_dir: Path, target_app: str, static_file_type: str) -> None:
-        """
-        Move the static files from the Webflow export to the static files location of the
-        Django target app.
-        """
-        dest_static_dir = f"{target_app}/static/{target_app}/{static_file_type}/"
-        os.makedirs(dest_static_dir, exist_ok=True)
-
-        source_static_dir = work_dir / static_file_type
-
-        try:
-            for file in os.listdir(source_static_dir.absolute()):
-                file_src = os.path.join(source_static_dir, file)
-                file_dest = os.path.join(dest_static_dir, file)
-                os.rename(file_src, file_dest)
-                sys.stdout.write(f'+ Moved {static_file_type} ({file} to {file_dest})\n')
-                self.static_files[static_file_type].append(file)
-        except FileNotFoundError:
-            sys.stdout.write(f'No {static_file_type} files found. Continuing.\n')
-
-    def move_html_files(self, work_dir: Path, target_app: str) -> None:
+    def extract_export(self, webflow_exported_assets: Path, target_app: str) -> None:
         """
-        Move the html files from the Webflow export to the templates location of the
-        Django target app.
+        Extract the static and html files from the Webflow export zip straight to their
+        locations in the Django target app, without unpacking to a working folder first.
         """
+        dest_static_root = f"{target_app}/static/{target_app}/"
         dest_html_dir = f"{target_app}/templates/"
-        os.makedirs(dest_html_dir, exist_ok=True)
 
-        source_html_dir = work_dir
-        for file in os.listdir(source_html_dir.absolute()):
-            if file.endswith('.html'):
-                file_src = os.path.join(source_html_dir, file)
-                file_dest = os.path.join(dest_html_dir, file)
-                os.rename(file_src, file_dest)
-                sys.stdout.write(f'+ Moved html ({file} to {file_dest})\n')
+        with zipfile.ZipFile(webflow_exported_assets) as zf:
+            for info in zf.infolist():
+                if info.is_dir():
+                    continue
 
-                self.html_paths.append(file_dest)
+                static_file_type, _, file = info.filename.partition('/')
+                if file and static_file_type in self.static_files:
+                    file_dest = zf.extract(info, dest_static_root)
+                    sys.stdout.write(f'+ Extracted {static_file_type} ({file} to {file_dest})\n')
+                    self.static_files[static_file_type].append(file)
 
-    def update_htmls(self, target_app: str) -> None:
+                elif not file and info.filename.endswith('.html'):
+                    zf.extract(info, dest_html_dir)
+                    file_dest = dest_html_dir + info.filename
+                    sys.stdout.write(f'+ Extracted html ({info.filename} to {file_dest})\n')
+                    self.html_paths.append(file_dest)
+
+        for static_file_type, files in self.static_files.items():
+            if not files:
+                sys.stdout.write(f'No {static_file_type} files found. Continuing.\n')
+
+    def update_htmls(self, target_app: str, pretty: bool = False) -> None:
         """
         Update all the exported html files that we exported from Webflow
         to use the correct static file paths.
+        The files are independent of each other, so we update them in parallel.
         """
-        for html_path in self.html_paths:
-            self.update_html(html_path, target_app)
+        update_html = partial(self.update_html, target_app=target_app, pretty=pretty)
+
+        # Starting worker processes costs more than updating a single file.
+        if len(self.html_paths) <= 1:
+            for html_path in self.html_paths:
+                update_html(html_path)
+            return
+
+        with ProcessPoolExecutor(max_workers=min(len(self.html_paths), os.cpu_count() or 1)) as executor:
+            list(executor.map(update_html, self.html_paths))
 
     @staticmethod
-    def update_html(html_path: str, target_app: str) -> None:
+    def update_html(html_path: str, target_app: str, pretty: bool = False) -> None:
         """
         Update an html file to use the correct
         static files paths that work with Django.
+        Django doesn't care about indentation, so we only indent the html when `pretty` is set.
         """
-        with open(html_path, 'r') as f:
-            soup = BeautifulSoup(f, 'html.parser')
-
-        # Update the links element.
-        for tag in soup.find_all('link'):
-            if tag.get('href').startswith("css"):
-                new_href = f"{{% static '{target_app}/{tag.get('href')}' %}}"
-                tag["href"] = new_href
-                sys.stdout.write(f'+ Updating link href to href=\"{new_href}\"\n')
-
-            if tag.get('href').startswith("images"):
-                new_href = f"{{% static '{target_app}/{tag.get('href')}' %}}"
-                tag["href"] = new_href
-                sys.stdout.write(f'+ Updating link href to href=\"{new_href}\"\n')
-
-        # Update img elements.
-        for tag in soup.find_all('img'):
-            if tag.get('src').startswith("images"):  # I.e., unconverted.
-                new_src = f"{{% static '{target_app}/{tag.get('src')}' %}}"
-                tag["src"] = new_src
-                sys.stdout.write(f'+ Updating img src to src=\"{new_src}\"\n')
-
-
-            if tag.get('srcset', '').startswith("images"):
-                new_srcset = re.sub(
-                    r"images/([^ ]+)",
-                    rf"{{% static '{target_app}/images/\g<1>' %}}",
-                    tag.get('srcset')
-                )
-                tag["srcset"] = new_srcset
-                sys.stdout.write(f'+ Updating img srcset to srcset=\"{new_srcset}\"\n')
-
-        # Update js elements.
-        for tag in soup.find_all('script'):
-            src = tag.get('src')
-            if src and src.startswith("js"):
-                new_src = f"{{% static '{target_app}/{tag.get('src')}' %}}"
-                tag["src"] = new_src
-                sys.stdout.write(f'+ Updating script src to src=\"{new_src}\"\n')
-
-        # Update the lottie animation elements.
-        for tag in soup.find_all('div', {'data-animation-type': 'lottie'}):
-            data_src = tag.get("data-src")
-            if data_src and data_src.startswith("documents"):
-                new_data_src = f"{{% static '{target_app}/{tag.get('data-src')}' %}}"
-                tag["data-src"] = new_data_src
-                sys.stdout.write(f'+ Updating lottie data-src to data-src=\"{new_data_src}\"\n')
-
-        # Find any element (including divs and img) with a data-for attribute.
-
-        # Convert any collection lists to for loops that render django template context.
-        for tag in soup.find_all(['div', 'img', 'li', 'ul'], {'data-for': True}):
+        tree = html.parse(html_path, parser=HTML_PARSER)
+
+        # Select the elements we rewrite in one XPath query, so libxml2 does the attribute filtering.
+        rewritten_elements = REWRITTEN_ELEMENTS_XPATH(tree)
+        if not rewritten_elements:
+            # Nothing references exported files or Django context, so leave the file as is.
+            sys.stdout.write(f'No updates needed for {html_path}. Skipped saving.\n')
+            return
+
+        if pretty:
+            # Indent before inserting the django tags, so they end up on their own lines.
+            etree.indent(tree, space='    ')
+
+        # Collect the log lines and write them once, rather than once per updated tag.
+        log_lines: List[str] = []
+
+        # Rewrite the selected elements in place.
+        csrf_tag = '{% csrf_token %}'
+        static_prefix = f"{{% static '{target_app}/"
+        static_suffix = "' %}"
+        # The same file is often referenced many times (e.g., in src and srcset), so cache the tags.
+        static_tags: Dict[str, str] = {}
+
+        def static_tag(path: str) -> str:
+            if path not in static_tags:
+                static_tags[path] = static_prefix + path + static_suffix
+            return static_tags[path]
+
+        for tag in rewritten_elements:
+            if tag.tag == 'link':
+                # Update the links element.
+                new_href = static_tag(tag.get('href'))
+                tag.set("href", new_href)
+                log_lines.append(f'+ Updating link href to href=\"{new_href}\"\n')
+
+            elif tag.tag == 'img':
+                # Update img elements.
+                if tag.get('src', '').startswith("images"):  # I.e., unconverted.
+                    new_src = static_tag(tag.get('src'))
+                    tag.set("src", new_src)
+                    log_lines.append(f'+ Updating img src to src=\"{new_src}\"\n')
+
+                srcset = tag.get('srcset', '')
+                if srcset.startswith("images"):
+                    # A srcset is a list of "<url> <descriptor>" candidates, e.g. "images/a.png 500w, ...".
+                    new_srcset_parts = []
+                    for srcset_part in srcset.split(','):
+                        url, _, descriptor = srcset_part.strip().partition(' ')
+                        if url.startswith("images/"):
+                            url = static_tag(url)
+                        new_srcset_parts.append(f"{url} {descriptor}" if descriptor else url)
+                    new_srcset = ', '.join(new_srcset_parts)
+                    tag.set("srcset", new_srcset)
+                    log_lines.append(f'+ Updating img srcset to srcset=\"{new_srcset}\"\n')
+
+            elif tag.tag == 'script':
+                # Update js elements.
+                new_src = static_tag(tag.get('src'))
+                tag.set("src", new_src)
+                log_lines.append(f'+ Updating script src to src=\"{new_src}\"\n')
+
+            elif (
+                tag.tag == 'div'
+                and tag.get('data-animation-type') == 'lottie'
+                and tag.get('data-src', '').startswith("documents")
+            ):
+                # Update the lottie animation elements. Lottie divs with a data-for attribute are
+                # selected whatever their data-src, so we still check it here.
+                new_data_src = static_tag(tag.get('data-src'))
+                tag.set("data-src", new_data_src)
+                log_lines.append(f'+ Updating lottie data-src to data-src=\"{new_data_src}\"\n')
+
+            elif tag.tag == 'form':
+                # Forms: Add the django csrf token to all forms.
+                tag.text = csrf_tag + (tag.text or '')
+                log_lines.append(f'+ Added django csrf token to all forms.\n')
+
+            # Convert any collection lists to for loops that render django template context.
+            # I.e., any div, img, li or ul element with a data-for attribute.
             for_loop_data = tag.get('data-for')
+            if not for_loop_data or tag.tag in ('link', 'script', 'form'):
+                continue
 
             if len(for_loop_data.split(" ")) > 1:  # E.g., "item in items"
-                # Insert the django forloop.
+                # Wrap the element's children in the django forloop.
                 dj_forloop_tag = f"{{% for {for_loop_data} %}}"
-                tag.insert(0, dj_forloop_tag)
-                tag.insert(-1, "{% endfor %}")
-                sys.stdout.write(f'+ Added for loop tag "{dj_forloop_tag}\"\n')
-            
+                tag.text = dj_forloop_tag + (tag.text or '')
+                if len(tag):
+                    tag[-1].tail = (tag[-1].tail or '') + "{% endfor %}"
+                else:
+                    tag.text += "{% endfor %}"
+                log_lines.append(f'+ Added for loop tag "{dj_forloop_tag}\"\n')
+
             else:  # E.g., "item.name"
                 # Insert the django variable.
-                if tag.name == 'img':
-                    tag['src'] = f"{{{{ {for_loop_data} }}}}"
+                if tag.tag == 'img':
+                    tag.set('src', f"{{{{ {for_loop_data} }}}}")
                 else:
                     dj_variable = "{{ " + for_loop_data + " }}"
-                    tag.insert(0, dj_variable)
-                    sys.stdout.write(f'+ Added variable tag "{dj_variable}\"\n')
+                    tag.text = dj_variable + (tag.text or '')
+                    log_lines.append(f'+ Added variable tag "{dj_variable}\"\n')
 
         # Insert the django static template tag.
-        html_tag = soup.find('html')
+        html_tag = tree.getroot()
         static_template_tag = '{% load static %}'
-        html_tag.insert(0, static_template_tag)
-        sys.stdout.write(f'+ Added  tag "{static_template_tag}\"\n')
-
-        # Forms: Add the django csrf token to all forms.
-        csrf_tag = '{% csrf_token %}'
-        for form_tag in soup.find_all('form'):
-            form_tag.insert(0, csrf_tag)
-            sys.stdout.write(f'+ Added django csrf token to all forms.\n')
+        html_tag.text = static_template_tag + (html_tag.text or '')
+        log_lines.append(f'+ Added  tag "{static_template_tag}\"\n')
 
-        # Forms: Make all forms async.
-        script_tag = soup.new_tag('script')
-        script_tag.append(make_forms_async)
-        soup.body.append(script_tag)
+        # Protect the attributes that libxml2 would percent-encode (see URI_ATTRIBUTES_XPATH).
+        attribute_values: List[str] = []
+        for attribute_value in URI_ATTRIBUTES_XPATH(tree):
+            attribute_values.append(str(attribute_value))
+            attribute_value.getparent().set(
+                attribute_value.attrname, ATTRIBUTE_PLACEHOLDER.format(len(attribute_values) - 1)
+            )
 
         # Write the updated html file
-        with open(html_path, 'w') as f:
-            f.write(str(soup.prettify(formatter=formatter.HTMLFormatter(indent=4))))
-            sys.stdout.write(f'Saved html file with updates to {html_path}\n')
+        output = html.tostring(tree, pretty_print=pretty, encoding='unicode')
+        output = ATTRIBUTE_PLACEHOLDER_RE.sub(
+            lambda match: quote_attribute_value(attribute_values[int(match.group(1))]), output
+        )
+
+        # Forms: Make all forms async. The script is fixed, so we splice it in pre-serialized.
+        body_end = output.rfind('</body>')
+        if body_end != -1:
+            output = output[:body_end] + make_forms_async_script + output[body_end:]
+
+        with open(html_path, 'w', encoding='utf-8') as f:
+            f.write(output)
+            log_lines.append(f'Saved html file with updates to {html_path}\n')
+
+        sys.stdout.write(''.join(log_lines))
 
 
 if __name__ == "__main__":
-    target_app = sys.argv[1]
-    webflow_exported_assets = Path(sys.argv[2])
-    working_folder = webflow_exported_assets.parent / "webflow_export"
+    parser = argparse.ArgumentParser(description='Import Webflow files into Django project.')
+    parser.add_argument('target_app', help='The Django app to import the Webflow files into.')
+    parser.add_argument('webflow_exported_assets', type=Path, help='The zip file exported from Webflow.')
+    parser.add_argument('--pretty', action='store_true', help='Indent the updated html files.')
+    args = parser.parse_args()
+
+    target_app = args.target_app
+    webflow_exported_assets = args.webflow_exported_assets
 
     if not Path(target_app).exists():
         raise FileNotFoundError(f'App directory not found at: {target_app} .')
 
-    shutil.unpack_archive(webflow_exported_assets, working_folder)
-
     importer = WebflowImporter()
-    importer.move_static_file(working_folder, target_app, 'js')
-    importer.move_static_file(working_folder, target_app, 'css')
-    importer.move_static_file(working_folder, target_app, 'images')
-    importer.move_static_file(working_folder, target_app, 'documents')
-    importer.move_html_files(working_folder, target_app)
-    importer.update_htmls(target_app)
+    importer.extract_export(webflow_exported_assets, target_app)
+    importer.update_htmls(target_app, pretty=args.pretty)
 
     sys.stdout.write(f'Imported {webflow_exported_assets} to {target_app}.\n')
-    send2trash(working_folder)
 
     delete_zip = str(input('Delete the zip file? (y/n): '))
     if delete_zip == 'y':
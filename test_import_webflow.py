@@ -0,0 +1,20 @@
+from import_webflow import WebflowImporter
+
+
+def test_update_html_keeps_template_tags_in_uri_attributes(tmp_path):
+    html_path = tmp_path / 'contact.html'
+    html_path.write_text(
+        '<!DOCTYPE html><html><body>'
+        '<a href="mailto:hello@example.com?subject=Hi there">Email us</a>'
+        '<form action="{% url \'contact\' %}" method="post"><input name="email"></form>'
+        '<img src="images/logo.png">'
+        '</body></html>',
+        encoding='utf-8',
+    )
+
+    WebflowImporter.update_html(str(html_path), 'web')
+
+    updated_html = html_path.read_text(encoding='utf-8')
+    assert 'action="{% url \'contact\' %}"' in updated_html
+    assert 'href="mailto:hello@example.com?subject=Hi there"' in updated_html
+    assert 'src="{% static \'web/images/logo.png\' %}"' in updated_html